@@ -1,12 +1,17 @@
 import os
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 import altair as alt
-from sqlalchemy import create_engine
+import connectorx as cx
+import duckdb
+from sqlalchemy import create_engine, make_url, text
 
 # -------------------------------------------------------------------
 # 1. Connexion à la base Postgres
@@ -19,73 +24,260 @@ DATABASE_URL = os.environ.get(
     "postgresql+psycopg2://app_user:app_password@db:5432/mba_db",
 )
 
-engine = create_engine(DATABASE_URL)
+
+@st.cache_resource
+def get_engine():
+    """
+    Engine SQLAlchemy partagé entre les réexécutions du script et les
+    sessions : un seul pool de connexions par processus Streamlit.
+    """
+    return create_engine(
+        DATABASE_URL,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=1800,   # évite les connexions Postgres périmées
+    )
+
+
+# connectorx ne connaît pas les suffixes de driver SQLAlchemy ("+psycopg2")
+CX_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(
+    hide_password=False
+)
+
+# Copie locale des transactions préparées, relue au démarrage tant que la
+# table n'a pas changé (voir `load_data`).
+PARQUET_CACHE_PATH = Path(
+    os.environ.get("PARQUET_CACHE_PATH", "/tmp/transactions.parquet")
+)
 
 
 # -------------------------------------------------------------------
 # 2. Chargement des données depuis Postgres
 # -------------------------------------------------------------------
-@st.cache_data
-def load_data() -> pd.DataFrame:
+WEEKDAY_ORDER = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+@dataclass(frozen=True)
+class TransactionsData:
+    """
+    Transactions préparées et métadonnées calculées une seule fois au
+    chargement, pour que la sidebar n'ait pas à rescanner le DataFrame.
+
+    L'instance est partagée entre réexécutions et sessions : le DataFrame
+    ne doit jamais être modifié en place.
+    """
+
+    df: pd.DataFrame
+    min_date: date
+    max_date: date
+
+
+def _fetch_transactions() -> pd.DataFrame:
     """
     Charge les données depuis la table 'transactions' de Postgres
     et prépare les variables nécessaires pour le dashboard.
     """
+    # Les types sont fixés côté SQL : connectorx décode le protocole binaire
+    # de Postgres directement en colonnes Arrow, sans objets Python
+    # intermédiaires, et le partitionnement sur `id` parallélise la lecture.
+    # Les types sont au plus juste pour alléger le DataFrame mis en cache :
+    # int32 pour les quantités, float32 pour les prix unitaires (< 2^24
+    # centimes, donc relus sans perte au centime près). Revenue reste en
+    # float64 : les lignes et surtout les sommes dépassent la mantisse d'un
+    # float32.
+    # Les dérivées temporelles sont aussi calculées par Postgres pendant le
+    # SELECT, plutôt que par les accesseurs `.dt` de pandas.
     query = """
         SELECT
-            bill_no     AS "BillNo",
-            itemname    AS "Itemname",
-            quantity    AS "Quantity",
-            date        AS "Date",
-            price       AS "Price",
-            customer_id AS "CustomerID",
-            country     AS "Country"
-        FROM transactions;
-    """
-
-    df = pd.read_sql(query, engine)
-
-    # Types
-    df["Date"] = pd.to_datetime(df["Date"])
-    df["Quantity"] = pd.to_numeric(df["Quantity"], errors="coerce").fillna(0).astype(int)
-    df["Price"] = pd.to_numeric(df["Price"], errors="coerce")
-
-    # Features dérivées
-    df["Revenue"] = df["Quantity"] * df["Price"]
-    df["InvoiceDate"] = df["Date"].dt.date               # pur type date → pour le filtre
-    df["InvoiceMonth"] = df["Date"].dt.to_period("M").dt.to_timestamp()  # pour les graphes mensuels
-    df["Hour"] = df["Date"].dt.hour
-    df["Weekday"] = df["Date"].dt.day_name()
+            id,
+            bill_no                     AS "BillNo",
+            itemname                    AS "Itemname",
+            COALESCE(quantity, 0)::int  AS "Quantity",
+            date                        AS "Date",
+            price::real                 AS "Price",
+            customer_id                 AS "CustomerID",
+            country                     AS "Country",
+            revenue                     AS "Revenue",
+            date::date                  AS "InvoiceDate",
+            date_trunc('month', date)   AS "InvoiceMonth",
+            EXTRACT(HOUR FROM date)::smallint       AS "Hour",
+            -- -1 : code « manquant » de pd.Categorical pour une date NULL
+            COALESCE(EXTRACT(ISODOW FROM date) - 1, -1)::smallint AS "WeekdayCode"
+        FROM transactions
+    """
+
+    table = cx.read_sql(
+        CX_DATABASE_URL,
+        query,
+        partition_on="id",
+        partition_num=4,
+        return_type="arrow",
+    )
+    # `id` ne sert qu'au partitionnement
+    df = table.drop_columns(["id"]).to_pandas()
+
+    # Features dérivées : InvoiceDate (pur type date → pour le filtre),
+    # InvoiceMonth (graphes mensuels), Hour et Revenue viennent de Postgres.
+    # Entier nullable : une date NULL donne une heure NULL, que connectorx
+    # renvoie en float NaN.
+    df["Hour"] = df["Hour"].astype("Int8")
+    # Jour de la semaine : simple lookup des codes 0 (lundi) … 6 (dimanche)
+    # dans WEEKDAY_ORDER, sans formater un nom de jour par ligne.
+    df["Weekday"] = pd.Categorical.from_codes(
+        df.pop("WeekdayCode").to_numpy(), categories=WEEKDAY_ORDER, ordered=True
+    )
+
+    # Colonnes à faible cardinalité en `category` : les groupby travaillent
+    # sur les codes entiers au lieu de hacher des chaînes.
+    df["Itemname"] = df["Itemname"].astype("category")
+    df["Country"] = df["Country"].astype("category")
+
+    # Numéro de ticket factorisé une fois pour toutes : les comptages de
+    # transactions distinctes hachent des int32 plutôt que des chaînes.
+    # factorize code un ticket NULL par -1 : il redevient NA (Int32
+    # nullable) pour être ignoré des comptages, comme la chaîne NULL l'était.
+    bill_codes = pd.factorize(df["BillNo"], sort=False)[0].astype(np.int32)
+    df["BillNoCode"] = pd.arrays.IntegerArray(bill_codes, bill_codes < 0)
 
     return df
 
 
+# Format de la copie Parquet, à incrémenter à la main dès que la requête de
+# `_fetch_transactions`, les colonnes dérivées ou leurs types changent. Les
+# versions de pandas et pyarrow, qui décident de la relecture des colonnes
+# `category` et des entiers nullables, en font aussi partie.
+PARQUET_CACHE_FORMAT = 2
+PARQUET_CACHE_SCHEMA = (
+    f"format {PARQUET_CACHE_FORMAT}|pandas {pd.__version__}|pyarrow {pa.__version__}"
+)
+
+
+def _data_version() -> str:
+    """
+    Version de la table (compteur de `transactions_version`, incrémenté par
+    trigger à chaque INSERT, UPDATE, DELETE ou TRUNCATE) et du format de la
+    copie Parquet, pour invalider cette dernière.
+    """
+    query = text("SELECT version FROM transactions_version")
+    with get_engine().connect() as conn:
+        table_version = conn.execute(query).scalar_one()
+    return f"{PARQUET_CACHE_SCHEMA}|{table_version}"
+
+
+def _replace_atomically(path: Path, write):
+    """
+    Écrit `path` via un fichier temporaire renommé ensuite : un lecteur
+    concurrent, ou un redémarrage en cours d'écriture, ne voit jamais de
+    fichier partiel.
+    """
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _read_parquet_cache(version: str) -> pd.DataFrame | None:
+    """
+    Relit la copie Parquet si elle correspond à `version`, sinon None.
+
+    Un fichier absent, illisible ou corrompu est traité comme un cache
+    vide : les données sont alors redemandées à Postgres.
+    """
+    version_path = PARQUET_CACHE_PATH.with_suffix(".version")
+    try:
+        if version_path.read_text() != version:
+            return None
+        return pd.read_parquet(PARQUET_CACHE_PATH, engine="pyarrow", memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def _write_parquet_cache(df: pd.DataFrame, version: str):
+    """
+    Écrit la copie Parquet (Snappy) et sa version.
+
+    La version est retirée avant d'écrire les données et reposée après :
+    en cas d'interruption, la copie n'est jamais associée à une version
+    qui n'est pas la sienne. Un répertoire en lecture seule ou plein
+    désactive simplement le cache.
+    """
+    version_path = PARQUET_CACHE_PATH.with_suffix(".version")
+    try:
+        version_path.unlink(missing_ok=True)
+        _replace_atomically(
+            PARQUET_CACHE_PATH,
+            lambda path: df.to_parquet(path, engine="pyarrow", compression="snappy"),
+        )
+        _replace_atomically(version_path, lambda path: path.write_text(version))
+    except (OSError, pa.ArrowInvalid):
+        pass
+
+
+# `cache_resource` et non `cache_data` : ce dernier renvoie une copie
+# désérialisée du DataFrame à chaque réexécution du script, alors que les
+# filtres et agrégations ne font que le lire.
+@st.cache_resource
+def load_data() -> TransactionsData:
+    """
+    Renvoie les transactions préparées et les métadonnées des filtres.
+
+    Le DataFrame préparé est aussi écrit en Parquet : au redémarrage de
+    l'application, il est relu depuis ce fichier plutôt que redemandé à
+    Postgres, tant que `_data_version` n'a pas changé.
+    """
+    version = _data_version()
+
+    df = _read_parquet_cache(version)
+    if df is None:
+        df = _fetch_transactions()
+        _write_parquet_cache(df, version)
+
+    # Métadonnées pour les filtres, prises sur `Date` (datetime64) : les
+    # dates NULL y sont des NaT ignorés par min/max, alors que la colonne
+    # objet `InvoiceDate` mélangerait objets `date` et NaN.
+    min_date = df["Date"].min()
+    max_date = df["Date"].max()
+
+    min_date = date.today() if pd.isna(min_date) else min_date.date()
+    max_date = date.today() if pd.isna(max_date) else max_date.date()
+
+    return TransactionsData(df=df, min_date=min_date, max_date=max_date)
+
+
 # -------------------------------------------------------------------
 # 3. Filtres (période, pays, quantité)
 # -------------------------------------------------------------------
-def filter_data(df: pd.DataFrame) -> pd.DataFrame:
+def get_filter_params(data: TransactionsData) -> tuple | None:
+    """
+    Affiche les filtres dans la sidebar et renvoie le tuple
+    (start_date, end_date, countries, quantity_threshold).
+
+    Ce tuple sert de clé de cache pour toutes les agrégations du dashboard
+    et de paramètres pour les requêtes SQL.
+    """
     st.sidebar.header("Filtres")
 
+    df = data.df
+
     if df.empty:
         st.sidebar.warning("Aucune donnée disponible.")
-        return df
-
-    # S'assurer que InvoiceDate est bien un type date
-    if not pd.api.types.is_datetime64_any_dtype(df["InvoiceDate"]):
-        df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"]).dt.date
-
-    min_date = df["InvoiceDate"].min()
-    max_date = df["InvoiceDate"].max()
-
-    if min_date is None or pd.isna(min_date):
-        min_date = date.today()
-    if max_date is None or pd.isna(max_date):
-        max_date = date.today()
+        return None
 
     # --------- Filtre période ---------
     date_range = st.sidebar.date_input(
         "Période",
-        value=(min_date, max_date),
+        value=(data.min_date, data.max_date),
         key="periode_filtre",
     )
 
@@ -97,27 +289,21 @@ def filter_data(df: pd.DataFrame) -> pd.DataFrame:
     else:
         start_date = end_date = date_range
 
-    filtered = df[
-        (df["InvoiceDate"] >= start_date)
-        & (df["InvoiceDate"] <= end_date)
-    ]
-
     # --------- Filtre pays ---------
-    countries = sorted(filtered["Country"].dropna().unique().tolist())
+    countries = countries_for_range(df, start_date, end_date)
     selected_countries = st.sidebar.multiselect(
         "Pays", options=countries, default=countries, key="filtre_pays"
     )
 
-    filtered = filtered[filtered["Country"].isin(selected_countries)]
+    quantities = quantity_range(df, start_date, end_date, tuple(selected_countries))
 
     # Si plus aucune ligne après période + pays → on s'arrête là
-    if filtered.empty:
+    if quantities is None:
         st.sidebar.warning("Aucune ligne après filtres période et pays.")
-        return filtered
+        return (start_date, end_date, tuple(selected_countries), None)
 
     # --------- Filtre quantité ---------
-    min_quantity = int(filtered["Quantity"].min())
-    max_quantity = int(filtered["Quantity"].max())
+    min_quantity, max_quantity = quantities
 
     if min_quantity == max_quantity:
         # Pas de slider possible, on fixe juste l'info
@@ -132,29 +318,352 @@ def filter_data(df: pd.DataFrame) -> pd.DataFrame:
             key="filtre_quantite",
         )
 
-    filtered = filtered[filtered["Quantity"] >= quantity_threshold]
+    return (start_date, end_date, tuple(selected_countries), quantity_threshold)
+
+
+def _period_mask(df: pd.DataFrame, start_date: date, end_date: date) -> np.ndarray:
+    dates = df["Date"].to_numpy()
+    return (dates >= np.datetime64(start_date)) & (
+        dates < np.datetime64(end_date + timedelta(days=1))
+    )
+
+
+def filter_positions(df: pd.DataFrame, params: tuple) -> np.ndarray:
+    """
+    Renvoie les positions des lignes qui passent le tuple de filtres.
+
+    Les conditions sont combinées en un seul masque NumPy ; la période est
+    testée sur `Date` (datetime64, borne haute exclusive) plutôt que sur
+    les objets `date` de `InvoiceDate`, bien plus lents à comparer.
+    """
+    start_date, end_date, countries, quantity_threshold = params
+
+    mask = _period_mask(df, start_date, end_date)
+    mask &= df["Country"].isin(countries).to_numpy()
+
+    if quantity_threshold is not None:
+        mask &= df["Quantity"].to_numpy() >= quantity_threshold
+
+    return np.flatnonzero(mask)
+
+
+# Options des widgets de la sidebar, mises en cache : déplacer le slider de
+# quantité ne recalcule ni la liste des pays ni les bornes du slider.
+# Les entrées sont petites mais leurs clés (période, pays) sans limite :
+# `max_entries` borne le cache, partagé par toutes les sessions.
+@st.cache_data(max_entries=128)
+def countries_for_range(_df: pd.DataFrame, start_date: date, end_date: date) -> list[str]:
+    codes = _df["Country"].cat.codes.to_numpy()[_period_mask(_df, start_date, end_date)]
+    codes = np.unique(codes)
+    return sorted(_df["Country"].cat.categories[codes[codes >= 0]].tolist())
+
+
+@st.cache_data(max_entries=128)
+def quantity_range(
+    _df: pd.DataFrame, start_date: date, end_date: date, countries: tuple
+) -> tuple[int, int] | None:
+    positions = filter_positions(_df, (start_date, end_date, countries, None))
+    if positions.size == 0:
+        return None
+    quantities = _df["Quantity"].to_numpy()[positions]
+    return int(quantities.min()), int(quantities.max())
+
+
+# -------------------------------------------------------------------
+# 4. Agrégations mises en cache
+# -------------------------------------------------------------------
+# Streamlit réexécute tout le script à chaque interaction (radio, slider).
+# Les agrégations ne dépendent que des filtres : on les met en cache sur le
+# tuple `params`. Ce tuple contient la valeur du slider de quantité, les
+# dates et les pays : le nombre de clés possibles est sans limite, et le
+# cache est partagé par toutes les sessions. `max_entries` borne la mémoire
+# en évinçant les jeux de filtres les plus anciens.
+AGG_CACHE_MAX_ENTRIES = 32
+#
+# Elles sont calculées par DuckDB, en SQL, sur une copie en mémoire des
+# colonnes utiles du DataFrame chargé par `load_data` : exécution
+# vectorisée et multi-threadée, agrégats par hachage des codes entiers des
+# colonnes `category` (importées comme ENUM), et le filtre est appliqué
+# pendant le scan au lieu de copier les lignes retenues.
+DUCKDB_COLUMNS = [
+    "Date",
+    "InvoiceMonth",
+    "Country",
+    "Quantity",
+    "Itemname",
+    "Revenue",
+    "Hour",
+    "Weekday",
+    "BillNoCode",
+    "CustomerID",
+]
+
+# Filtres du dashboard traduits en SQL, avec les paramètres nommés de
+# DuckDB. La période est testée sur `Date` avec une borne haute exclusive.
+DUCKDB_FILTERS = """
+    WHERE "Date" >= $start_date
+      AND "Date" < $end_date
+      AND "Country" IN (SELECT unnest($countries::VARCHAR[]))
+      AND ($qty_threshold IS NULL OR "Quantity" >= $qty_threshold)
+"""
+
+
+def _duckdb_filter_params(params: tuple) -> dict:
+    """
+    Convertit le tuple de filtres (start_date, end_date, countries,
+    quantity_threshold) en paramètres pour `DUCKDB_FILTERS`.
+    """
+    start_date, end_date, countries, quantity_threshold = params
+    return {
+        "start_date": start_date,
+        "end_date": end_date + timedelta(days=1),
+        "countries": list(countries),
+        "qty_threshold": quantity_threshold,
+    }
+
+
+@st.cache_resource
+def get_duckdb() -> duckdb.DuckDBPyConnection:
+    """
+    Base DuckDB en mémoire partagée par le processus, avec une table
+    `transactions` copiée une fois depuis le DataFrame de `load_data`.
+
+    Une table native plutôt qu'une vue sur le DataFrame : sans elle, chaque
+    requête reconvertirait les colonnes `category` en ENUM pendant le scan.
+    """
+    con = duckdb.connect()
+    con.register("frame", load_data().df[DUCKDB_COLUMNS])
+    con.execute("CREATE TABLE transactions AS SELECT * FROM frame")
+    con.unregister("frame")
+    return con
+
+
+def _duckdb_query(select: str, params: tuple, keys: list[str]) -> pd.DataFrame:
+    """
+    Exécute `select` sur les transactions filtrées par `params`, groupées
+    sur ses expressions non agrégées (`GROUP BY ALL`).
+
+    Les lignes dont une colonne de `keys` est NULL sont écartées, comme
+    les clés manquantes d'un groupby pandas ; les colonnes de `keys`
+    doivent donc représenter une valeur manquante par NULL, pas par un
+    code sentinelle (voir `BillNoCode`). Chaque appel passe par son
+    propre curseur : les agrégations sont aussi lancées depuis les threads
+    de `prefetch_aggregates`, et une connexion DuckDB ne doit pas être
+    partagée entre threads.
+    """
+    not_null = "".join(f' AND "{key}" IS NOT NULL' for key in keys)
+    query = f"{select} FROM transactions {DUCKDB_FILTERS} {not_null} GROUP BY ALL"
+    return get_duckdb().cursor().execute(query, _duckdb_filter_params(params)).df()
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def kpi_agg(params: tuple) -> dict:
+    """
+    KPIs globaux, calculés sur la même copie des données que les sections
+    (et non sur la table Postgres, qui peut avoir changé depuis le
+    chargement) : tous les chiffres de la page restent cohérents.
+    """
+    row = _duckdb_query(
+        """
+        SELECT
+            COUNT(DISTINCT "BillNoCode")    AS n_transactions,
+            COUNT(DISTINCT "Itemname")      AS n_items,
+            COUNT(DISTINCT "CustomerID")    AS n_customers,
+            COALESCE(FSUM("Revenue"), 0)    AS total_revenue
+        """,
+        params,
+        [],
+    ).iloc[0]
+
+    return {
+        "n_transactions": int(row["n_transactions"]),
+        "n_items": int(row["n_items"]),
+        "n_customers": int(row["n_customers"]),
+        "total_revenue": float(row["total_revenue"]),
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def ts_agg(params: tuple, freq: str) -> pd.DataFrame:
+    # InvoiceDate (objets `date` Python) n'est pas copiée dans DuckDB :
+    # elle est recalculée depuis `Date`.
+    date_col = '"Date"::DATE AS "InvoiceDate"' if freq == "Jour" else '"InvoiceMonth"'
+    return _duckdb_query(
+        f'SELECT {date_col}, COUNT(DISTINCT "BillNoCode") AS "Transactions"',
+        params,
+        [],
+    )
+
+
+# Les sommes suivent un groupby pandas : BIGINT pour les quantités (SUM de
+# DuckDB renvoie un HUGEINT, lu en float), sommation compensée (FSUM) et 0
+# plutôt que NULL pour le chiffre d'affaires.
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def product_agg(params: tuple) -> pd.DataFrame:
+    return _duckdb_query(
+        """
+        SELECT
+            "Itemname",
+            SUM("Quantity")::BIGINT         AS quantity_sold,
+            COALESCE(FSUM("Revenue"), 0)    AS revenue,
+            COUNT(DISTINCT "BillNoCode")    AS n_transactions
+        """,
+        params,
+        ["Itemname"],
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def basket_agg(params: tuple) -> pd.DataFrame:
+    # On agrège par ticket (BillNo), via son code entier. Les lignes sans
+    # numéro de ticket (BillNoCode NULL) ne forment pas un panier.
+    return _duckdb_query(
+        """
+        SELECT
+            "BillNoCode",
+            COUNT(DISTINCT "Itemname")      AS basket_size,
+            SUM("Quantity")::BIGINT         AS quantity_total,
+            COALESCE(FSUM("Revenue"), 0)    AS revenue
+        """,
+        params,
+        ["BillNoCode"],
+    ).set_index("BillNoCode")
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def country_agg(params: tuple) -> pd.DataFrame:
+    return _duckdb_query(
+        """
+        SELECT
+            "Country",
+            COUNT(DISTINCT "BillNoCode")    AS transactions,
+            COALESCE(FSUM("Revenue"), 0)    AS revenue
+        """,
+        params,
+        ["Country"],
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=AGG_CACHE_MAX_ENTRIES)
+def heatmap_agg(params: tuple) -> pd.DataFrame:
+    return _duckdb_query(
+        """
+        SELECT
+            "Weekday",
+            "Hour",
+            COUNT(DISTINCT "BillNoCode")    AS transactions
+        """,
+        params,
+        ["Weekday", "Hour"],
+    )
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Pool de threads partagé, utilisé pour précalculer les agrégations.
+    """
+    return ThreadPoolExecutor(max_workers=5)
+
+
+def prefetch_aggregates(params: tuple):
+    """
+    Lance en arrière-plan les agrégations des sections légères pour le
+    tuple de filtres courant, sans attendre leur résultat.
+
+    Elles sont indépendantes et DuckDB relâche le GIL pendant l'exécution
+    des requêtes : les caches sont chauds quand l'utilisateur change de
+    section. Le travail n'est soumis qu'une fois par jeu de filtres.
+
+    `product_agg` et `basket_agg` (une ligne par article ou par ticket,
+    l'essentiel de la mémoire des caches) ne sont pas précalculées : elles
+    ne sont mises en cache que pour les sections réellement ouvertes.
+
+    Le pool est partagé par toutes les sessions : quand les filtres
+    changent (slider déplacé), les calculs encore en file pour les anciens
+    filtres de la session sont annulés, pour ne pas retarder ceux que
+    l'utilisateur attend.
+
+    Les agrégations sont déclarées avec `show_spinner=False` : les threads
+    du pool n'ont pas de ScriptRunContext dans lequel afficher un spinner.
+    """
+    if st.session_state.get("prefetched_params") == params:
+        return
+    st.session_state["prefetched_params"] = params
+
+    # Sans effet sur un calcul déjà démarré, qui va à son terme
+    for future in st.session_state.get("prefetch_futures", []):
+        future.cancel()
+
+    executor = get_executor()
+    st.session_state["prefetch_futures"] = [
+        executor.submit(aggregate, *args)
+        for aggregate, args in (
+            (ts_agg, (params, "Jour")),
+            (ts_agg, (params, "Mois")),
+            (country_agg, (params,)),
+            (heatmap_agg, (params,)),
+        )
+    ]
+
+
+# Specs Vega-Lite des graphiques en barres, mises en cache sur les filtres et
+# les widgets qui les pilotent : une réexécution ne reconstruit pas l'objet
+# Altair et ne resérialise pas ses données en JSON.
+TOP_PRODUCT_MODES = {
+    "Quantité vendue": ("quantity_sold", "Top produits par quantité"),
+    "Chiffre d'affaires": ("revenue", "Top produits par chiffre d'affaires"),
+}
 
-    return filtered
+
+@st.cache_data(max_entries=AGG_CACHE_MAX_ENTRIES)
+def top_products_spec(params: tuple, mode: str, top_n: int) -> dict:
+    value_col, title = TOP_PRODUCT_MODES[mode]
+    top = product_agg(params).nlargest(top_n, value_col)
+
+    chart = (
+        alt.Chart(top)
+        .mark_bar()
+        .encode(
+            x=alt.X(f"{value_col}:Q", title=mode),
+            y=alt.Y("Itemname:N", sort="-x", title="Produit"),
+            tooltip=["Itemname:N", "quantity_sold:Q", "revenue:Q", "n_transactions:Q"],
+        )
+    )
+    return chart.properties(title=title, height=400).to_dict()
+
+
+@st.cache_data(max_entries=AGG_CACHE_MAX_ENTRIES)
+def country_spec(params: tuple, top_countries: int) -> dict:
+    top = country_agg(params).nlargest(top_countries, "revenue")
+
+    chart = (
+        alt.Chart(top)
+        .mark_bar()
+        .encode(
+            x=alt.X("revenue:Q", title="Chiffre d'affaires"),
+            y=alt.Y("Country:N", sort="-x", title="Pays"),
+            tooltip=["Country:N", "transactions:Q", "revenue:Q"],
+        )
+    )
+    return chart.properties(title="CA par pays", height=300).to_dict()
 
 
 # -------------------------------------------------------------------
-# 4. Sections de dashboard
+# 5. Sections de dashboard
 # -------------------------------------------------------------------
-def kpi_section(df: pd.DataFrame):
+def kpi_section(params: tuple):
     col1, col2, col3, col4 = st.columns(4)
 
-    n_transactions = df["BillNo"].nunique()
-    n_items = df["Itemname"].nunique()
-    n_customers = df["CustomerID"].nunique()
-    total_revenue = df["Revenue"].sum()
+    kpis = kpi_agg(params)
+    n_transactions = kpis["n_transactions"]
+    n_items = kpis["n_items"]
+    n_customers = kpis["n_customers"]
+    total_revenue = kpis["total_revenue"]
 
     col1.metric("Transactions", f"{n_transactions:,}".replace(",", " "))
     col2.metric("Articles distincts", f"{n_items:,}".replace(",", " "))
-
-    if not np.isnan(n_customers):
-        col3.metric("Clients", f"{int(n_customers):,}".replace(",", " "))
-    else:
-        col3.metric("Clients", "N/A")
+    col3.metric("Clients", f"{n_customers:,}".replace(",", " "))
 
     col4.metric(
         "Chiffre d'affaires",
@@ -166,7 +675,7 @@ def kpi_section(df: pd.DataFrame):
     )
 
 
-def transactions_over_time(df: pd.DataFrame):
+def transactions_over_time(params: tuple):
     st.subheader("Transactions dans le temps")
 
     freq = st.radio(
@@ -176,23 +685,15 @@ def transactions_over_time(df: pd.DataFrame):
         key="freq_radio",
     )
 
+    ts = ts_agg(params, freq)
+
     if freq == "Jour":
-        ts = (
-            df.groupby("InvoiceDate")["BillNo"]
-            .nunique()
-            .reset_index(name="Transactions")
-        )
         chart = alt.Chart(ts).mark_line(point=True).encode(
             x=alt.X("InvoiceDate:T", title="Date"),
             y=alt.Y("Transactions:Q", title="Nombre de transactions"),
             tooltip=["InvoiceDate:T", "Transactions:Q"],
         )
     else:
-        ts = (
-            df.groupby("InvoiceMonth")["BillNo"]
-            .nunique()
-            .reset_index(name="Transactions")
-        )
         chart = alt.Chart(ts).mark_line(point=True).encode(
             x=alt.X("InvoiceMonth:T", title="Mois"),
             y=alt.Y("Transactions:Q", title="Nombre de transactions"),
@@ -202,44 +703,23 @@ def transactions_over_time(df: pd.DataFrame):
     st.altair_chart(chart.properties(height=300), use_container_width=True)
 
 
-def top_products(df: pd.DataFrame):
+def top_products(params: tuple):
     st.subheader("Top produits")
 
-    if df.empty:
+    agg = product_agg(params)
+
+    if agg.empty:
         st.info("Aucune donnée disponible pour les produits avec les filtres actuels.")
         return
 
     mode = st.radio(
         "Classer par :",
-        options=["Quantité vendue", "Chiffre d'affaires"],
+        options=list(TOP_PRODUCT_MODES),
         horizontal=True,
         key="top_mode",
     )
 
-    agg = (
-        df.groupby("Itemname")
-        .agg(
-            quantity_sold=("Quantity", "sum"),
-            revenue=("Revenue", "sum"),
-            n_transactions=("BillNo", "nunique"),
-        )
-        .reset_index()
-    )
-
-    if mode == "Quantité vendue":
-        agg = agg.sort_values("quantity_sold", ascending=False)
-        value_col = "quantity_sold"
-        title = "Top produits par quantité"
-    else:
-        agg = agg.sort_values("revenue", ascending=False)
-        value_col = "revenue"
-        title = "Top produits par chiffre d'affaires"
-
     n_products = len(agg)
-    if n_products == 0:
-        st.info("Aucun produit après filtrage.")
-        return
-
     if n_products == 1:
         st.sidebar.info("Un seul produit disponible avec les filtres actuels.")
         top_n = 1
@@ -252,39 +732,26 @@ def top_products(df: pd.DataFrame):
             key="top_n_slider",
         )
 
-    top = agg.head(top_n)
-
-    chart = (
-        alt.Chart(top)
-        .mark_bar()
-        .encode(
-            x=alt.X(f"{value_col}:Q", title=mode),
-            y=alt.Y("Itemname:N", sort="-x", title="Produit"),
-            tooltip=["Itemname:N", "quantity_sold:Q", "revenue:Q", "n_transactions:Q"],
-        )
+    st.vega_lite_chart(
+        top_products_spec(params, mode, top_n), use_container_width=True
     )
 
-    st.altair_chart(chart.properties(title=title, height=400), use_container_width=True)
-
     with st.expander("Table des produits (top)"):
-        st.dataframe(top)
+        # Sélection partielle par tas : O(g log top_n) au lieu d'un tri complet
+        value_col, _ = TOP_PRODUCT_MODES[mode]
+        st.dataframe(agg.nlargest(top_n, value_col))
 
 
 
-def basket_analysis(df: pd.DataFrame):
+def basket_analysis(params: tuple):
     st.subheader("Analyse des paniers (Market Basket)")
 
-    if df.empty:
+    baskets = basket_agg(params)
+
+    if baskets.empty:
         st.info("Aucune donnée disponible pour l'analyse des paniers avec les filtres actuels.")
         return
 
-    # On agrège par ticket (BillNo)
-    baskets = df.groupby("BillNo").agg(
-        basket_size=("Itemname", "nunique"),
-        quantity_total=("Quantity", "sum"),
-        revenue=("Revenue", "sum"),
-    )
-
     # KPIs
     col1, col2, col3 = st.columns(3)
     col1.metric("Taille moyenne du panier", f"{baskets['basket_size'].mean():.2f}")
@@ -294,12 +761,13 @@ def basket_analysis(df: pd.DataFrame):
     col3.metric("CA moyen par panier", f"{baskets['revenue'].mean():.2f} €")
 
     # Distribution de la taille des paniers
+    # value_counts sans tri par effectif : seul l'ordre des tailles compte
     size_counts = (
         baskets["basket_size"]
-        .value_counts()
+        .value_counts(sort=False)
+        .sort_index()
         .rename_axis("basket_size")   # le nom de l'index devient 'basket_size'
         .reset_index(name="count")    # la série de counts devient une colonne 'count'
-        .sort_values("basket_size")
     )
 
     chart = (
@@ -328,27 +796,16 @@ def basket_analysis(df: pd.DataFrame):
 
 
 
-def country_analysis(df: pd.DataFrame):
+def country_analysis(params: tuple):
     st.subheader("Répartition géographique")
 
-    if df.empty:
+    country_stats = country_agg(params)
+
+    if country_stats.empty:
         st.info("Aucune donnée disponible pour la répartition géographique.")
         return
 
-    country_stats = (
-        df.groupby("Country")
-        .agg(
-            transactions=("BillNo", "nunique"),
-            revenue=("Revenue", "sum"),
-        )
-        .reset_index()
-        .sort_values("revenue", ascending=False)
-    )
-
     n_countries = len(country_stats)
-    if n_countries == 0:
-        st.info("Aucun pays trouvé après filtrage.")
-        return
 
     # Si un seul pays → pas de slider, on affiche juste ce pays
     if n_countries == 1:
@@ -364,49 +821,19 @@ def country_analysis(df: pd.DataFrame):
             key="top_countries_slider",
         )
 
-    top = country_stats.head(top_countries)
-
-    chart = (
-        alt.Chart(top)
-        .mark_bar()
-        .encode(
-            x=alt.X("revenue:Q", title="Chiffre d'affaires"),
-            y=alt.Y("Country:N", sort="-x", title="Pays"),
-            tooltip=["Country:N", "transactions:Q", "revenue:Q"],
-        )
-    )
-
-    st.altair_chart(
-        chart.properties(title="CA par pays", height=300),
-        use_container_width=True,
+    st.vega_lite_chart(
+        country_spec(params, top_countries), use_container_width=True
     )
 
     with st.expander("Table complète pays"):
-        st.dataframe(country_stats)
+        st.dataframe(country_stats.sort_values("revenue", ascending=False))
 
 
 
-def temporal_pattern(df: pd.DataFrame):
+def temporal_pattern(params: tuple):
     st.subheader("Patterns temporels (jour de la semaine × heure)")
 
-    heat = (
-        df.groupby(["Weekday", "Hour"])["BillNo"]
-        .nunique()
-        .reset_index(name="transactions")
-    )
-
-    weekday_order = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    heat["Weekday"] = pd.Categorical(
-        heat["Weekday"], categories=weekday_order, ordered=True
-    )
+    heat = heatmap_agg(params)
 
     chart = (
         alt.Chart(heat)
@@ -429,7 +856,7 @@ def temporal_pattern(df: pd.DataFrame):
 
 
 # -------------------------------------------------------------------
-# 5. App principale
+# 6. App principale
 # -------------------------------------------------------------------
 def main():
     st.set_page_config(
@@ -440,37 +867,39 @@ def main():
 
     st.title("Market Basket Analysis – Dashboard")
 
-    df = load_data()
+    data = load_data()
+    df = data.df
 
     if df.empty:
         st.error("Aucune donnée chargée depuis la base de données.")
         return
 
-    filtered_df = filter_data(df)
+    params = get_filter_params(data)
+    positions = filter_positions(df, params)
 
-    st.info(f"{len(filtered_df):,} lignes après filtrage.".replace(",", " "))
+    st.info(f"{positions.size:,} lignes après filtrage.".replace(",", " "))
 
     # KPIs globales
-    kpi_section(filtered_df)
-
-    # Onglets
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(
-        ["Vue temporelle", "Top produits", "Paniers", "Pays", "Patterns temporels"]
-    )
-
-    with tab1:
-        transactions_over_time(filtered_df)
-    with tab2:
-        top_products(filtered_df)
-    with tab3:
-        basket_analysis(filtered_df)
-    with tab4:
-        country_analysis(filtered_df)
-    with tab5:
-        temporal_pattern(filtered_df)
+    kpi_section(params)
+
+    # Sections : contrairement à st.tabs, qui exécute le contenu de tous les
+    # onglets à chaque réexécution, seule la section affichée est calculée.
+    sections = {
+        "Vue temporelle": transactions_over_time,
+        "Top produits": top_products,
+        "Paniers": basket_analysis,
+        "Pays": country_analysis,
+        "Patterns temporels": temporal_pattern,
+    }
+    active = st.radio("Section", options=list(sections), horizontal=True, key="section")
+    sections[active](params)
+
+    # La section affichée est servie en priorité ; les autres sont calculées
+    # ensuite en parallèle pour que le changement de section soit immédiat.
+    prefetch_aggregates(params)
 
     with st.expander("Aperçu des données brutes"):
-        st.dataframe(filtered_df.head(100))
+        st.dataframe(df.iloc[positions[:100]])
 
 
 if __name__ == "__main__":
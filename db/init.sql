@@ -19,6 +19,8 @@ WITH (
 );
 
 -- 3) Table finale (BillNo et CustomerID sont TEXT)
+--    revenue est une colonne générée : calculée une fois à l'insertion
+--    au lieu d'être recalculée à chaque chargement du dashboard.
 CREATE TABLE transactions (
     id          SERIAL PRIMARY KEY,
     bill_no     TEXT,
@@ -27,7 +29,9 @@ CREATE TABLE transactions (
     date        TIMESTAMP,
     price       NUMERIC(10,2),
     customer_id TEXT,
-    country     TEXT
+    country     TEXT,
+    revenue     DOUBLE PRECISION
+        GENERATED ALWAYS AS ((COALESCE(quantity, 0) * price)::DOUBLE PRECISION) STORED
 );
 
 -- 4) Insertion sans convertir BillNo / CustomerID en bigint
@@ -43,3 +47,30 @@ SELECT
 FROM raw_import;
 
 DROP TABLE raw_import;
+
+-- 5) Index pour les filtres et agrégations du dashboard
+CREATE INDEX idx_transactions_date    ON transactions (date) INCLUDE (revenue, bill_no);
+CREATE INDEX idx_transactions_country ON transactions (country);
+CREATE INDEX idx_transactions_bill_no ON transactions (bill_no);
+
+-- 6) Marqueur de changement de la table : incrémenté par un trigger à
+--    chaque instruction qui modifie transactions. Le dashboard s'en sert
+--    pour savoir si sa copie locale (Parquet) est encore à jour.
+CREATE TABLE transactions_version (
+    id         BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),   -- une seule ligne
+    version    BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO transactions_version DEFAULT VALUES;
+
+CREATE FUNCTION bump_transactions_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE transactions_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER transactions_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_transactions_version();
@@ -0,0 +1,35 @@
+-- Migration d'une base créée avec une version antérieure de init.sql
+-- (init.sql n'est exécuté que sur un volume db_data vide).
+--
+-- Ajoute la colonne générée revenue et les index utilisés par le
+-- dashboard. Le script est idempotent : il peut être rejoué sans risque.
+
+BEGIN;
+
+-- 1) Chiffre d'affaires par ligne, calculé une fois par Postgres
+ALTER TABLE transactions
+    ADD COLUMN IF NOT EXISTS revenue DOUBLE PRECISION
+        GENERATED ALWAYS AS ((COALESCE(quantity, 0) * price)::DOUBLE PRECISION) STORED;
+
+-- 2) Une première version de l'index sur date ne couvrait pas revenue ni
+--    bill_no : on la supprime pour la recréer avec INCLUDE.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = 'idx_transactions_date'
+          AND i.indnatts = i.indnkeyatts
+    ) THEN
+        DROP INDEX idx_transactions_date;
+    END IF;
+END
+$$;
+
+-- 3) Index pour les filtres et agrégations du dashboard
+CREATE INDEX IF NOT EXISTS idx_transactions_date    ON transactions (date) INCLUDE (revenue, bill_no);
+CREATE INDEX IF NOT EXISTS idx_transactions_country ON transactions (country);
+CREATE INDEX IF NOT EXISTS idx_transactions_bill_no ON transactions (bill_no);
+
+COMMIT;
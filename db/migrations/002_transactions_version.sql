@@ -0,0 +1,28 @@
+-- Migration d'une base créée avec une version antérieure de init.sql.
+--
+-- Ajoute le marqueur de changement de la table transactions, lu par le
+-- dashboard pour invalider sa copie Parquet. Le script est idempotent :
+-- il peut être rejoué sans risque.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS transactions_version (
+    id         BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),   -- une seule ligne
+    version    BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO transactions_version DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_transactions_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE transactions_version SET version = version + 1, updated_at = now();
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE TRIGGER transactions_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON transactions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_transactions_version();
+
+COMMIT;